@@ -1,5 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
+_PARSE_BATCH_SIZE = 1000
+
 
 class JPDBHandler:
     def __init__(self, api_token):
@@ -96,7 +100,20 @@ class JPDBHandler:
             print("WaniWords deck NOT found! Creating Deck...")
             waniwords_deck_id = self._create_waniwords_deck(len(deck_names_list))
 
-        ids_list = self._get_vocabulary_ids(words_list)
+        # Parse the words in batches, several at a time, instead of one large request
+        words_list_slices = [
+            words_list[i:i + _PARSE_BATCH_SIZE] for i in range(0, len(words_list), _PARSE_BATCH_SIZE)
+        ]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            ids_batches = executor.map(self._get_vocabulary_ids, words_list_slices)
+            ids_list = []
+            seen_ids = set()
+            for ids_batch in ids_batches:
+                for vocabulary_ids in ids_batch:
+                    vid_sid = tuple(vocabulary_ids)  # [vid, sid] lists aren't hashable
+                    if vid_sid not in seen_ids:
+                        seen_ids.add(vid_sid)
+                        ids_list.append(vocabulary_ids)
         self._add_vocabulary_ids_waniwords_deck(waniwords_deck_id, ids_list)
 
 
@@ -14,6 +14,7 @@ def main():
     words_list = utility_and_filters.get_common_words_list(1000)
     words_list = utility_and_filters.filter_out_unknown_kanji(words_list, wk_handler)
     words_list = utility_and_filters.filter_out_known_words(words_list, wk_handler)
+    wk_handler.close()  # No more WaniKani data is needed past this point
     print("Filtered out known words down to [%d]:\n" % len(words_list) + str(words_list))
 
     jpdb_handler.add_vocabulary_to_waniwords_deck(words_list)
@@ -1,11 +1,19 @@
-import json
+import re
+
+import orjson
 
 from wanikani import WaniKaniHandler
 
 _FREQUENCY_LIST_FILE = "Frequency_List.json"
 _FREQ_SOURCE_FILE = "BCCWJ_frequencylist_suw_ver1_0.tsv"
 _BLACKLISTED_WORD_TYPES = ["助詞", "助動詞", "接尾辞", "数詞", "固有名詞"]
-_KANA_LIST = [
+# Matches the types anywhere in the raw word type column, e.g. 助動詞 also catches 形状詞-助動詞語幹
+_BLACKLISTED_WORD_TYPES_PATTERN = re.compile(
+    "|".join(re.escape(word_type) for word_type in _BLACKLISTED_WORD_TYPES).encode('utf-8')
+)
+_BLACKLISTED_SYMBOLS = ["■", "．", "×"]  # ■ is used by BCCWJ to mask out redacted text
+_BLACKLISTED_SYMBOLS_PATTERN = re.compile("|".join(re.escape(symbol) for symbol in _BLACKLISTED_SYMBOLS))
+_KANA_SET = frozenset((
     'ぁ', 'あ', 'ぃ', 'い', 'ぅ', 'う', 'ゔ', 'ぇ', 'え', 'ぉ', 'お', 'ゕ', 'か', 'が', 'き', 'ぎ', 'く', 'ぐ', 'ゖ', 'け', 'げ',
     'こ', 'ご', 'さ', 'ざ', 'し', 'じ', 'す', 'ず', 'せ', 'ぜ', 'そ', 'ぞ', 'た', 'だ', 'ち', 'ぢ', 'っ', 'つ', 'づ', 'て', 'で',
     'と', 'ど', 'な', 'に', 'ぬ', 'ね', 'の', 'は', 'ば', 'ぱ', 'ひ', 'び', 'ぴ', 'ふ', 'ぶ', 'ぷ', 'へ', 'べ', 'ぺ', 'ほ', 'ぼ',
@@ -15,32 +23,33 @@ _KANA_LIST = [
     'テ', 'デ', 'ト', 'ド', 'ナ', 'ニ', 'ヌ', 'ネ', 'ノ', 'ハ', 'バ', 'パ', 'ヒ', 'ビ', 'ピ', 'フ', 'ブ', 'プ', 'ベ', 'ペ', 'ホ',
     'ボ', 'ポ', 'マ', 'ミ', 'ム', 'メ', 'モ', 'ャ', 'ヤ', 'ュ', 'ユ', 'ョ', 'ヨ', 'ラ', 'リ', 'ル', 'レ', 'ロ', 'ヮ', 'ワ', 'ヷ',
     'ヰ', 'ヸ', 'ヱ', 'ヹ', 'ヲ', 'ヺ', 'ン', '・', 'ー'
-]
+))
 
 def generate_frequency_list_file() -> None:
     """
     Generate a Frequency List file from the BCCWJ database file
-    Filters out words that are categorized as any of the Blacklisted Types
+    Filters out words that are categorized as any of the Blacklisted Types, or that contain any Blacklisted Symbols
+    Words that appear more than once (e.g. under different word types) are only kept at their most frequent position
     """
-    with open(_FREQUENCY_LIST_FILE, "w") as frequency_list_file:
+    with open(_FREQUENCY_LIST_FILE, "wb") as frequency_list_file:
         list_of_words = []
-        with open(_FREQ_SOURCE_FILE, "r", encoding='utf-8') as freq_source_file:
+        seen_words = set()
+        # Read as bytes so that rows with a blacklisted type are skipped before anything is decoded
+        with open(_FREQ_SOURCE_FILE, "rb", buffering=1 << 20) as freq_source_file:  # 1MB buffer for the large file
+            next(freq_source_file)  # Skip the header row
             for line in freq_source_file:
-                data = line.split('\t')
-                word = data[2]
-                word_type = data[3]
-                word_is_blacklisted = False
-                for blacklisted_type in _BLACKLISTED_WORD_TYPES:
-                    if blacklisted_type in word_type:
-                        word_is_blacklisted = True
-                        break
-                if not word_is_blacklisted:
-                    list_of_words.append(word)
-        json.dump(
-            list_of_words[1:],
-            frequency_list_file,
-            indent=0
-        )
+                data = line.split(b'\t', 4)  # Only the first four columns are needed
+                word_type = data[3]  # Hyphen-separated categories, e.g. 名詞-固有名詞-人名-一般
+                if _BLACKLISTED_WORD_TYPES_PATTERN.search(word_type):
+                    continue
+                word = data[2].decode('utf-8')
+                if _BLACKLISTED_SYMBOLS_PATTERN.search(word):
+                    continue
+                if word in seen_words:
+                    continue
+                seen_words.add(word)
+                list_of_words.append(word)
+        frequency_list_file.write(orjson.dumps(list_of_words))
 
 def get_common_words_list(num_of_words: int) -> list[str]:
     """
@@ -48,8 +57,8 @@ def get_common_words_list(num_of_words: int) -> list[str]:
     :param num_of_words: The number of words to retrieve (e.g. 500 = the 500 most common words)
     :return: List of words sorted by frequency according to the frequency list file
     """
-    with open(_FREQUENCY_LIST_FILE, "r", encoding='utf-8') as frequency_list_file:
-        words_list = json.load(frequency_list_file)
+    with open(_FREQUENCY_LIST_FILE, "rb") as frequency_list_file:
+        words_list = orjson.loads(frequency_list_file.read())
         if len(words_list) < num_of_words:  # Cap up_to_frequency to the length of word_list
             print("Frequency list doesn't contain %d words. Could only retrieve %d.", (num_of_words, len(words_list)))
             return words_list
@@ -64,12 +73,10 @@ def filter_out_known_words(list_of_words: list[str], wanikani_handler: WaniKaniH
     :param invert_filter: whether the filter should be inverted (i.e. filter out unknown words)
     :return: new, filtered list of words
     """
-    known_vocabulary = wanikani_handler.get_known_vocabulary_list()
-    new_list_of_words = []
-    for word in list_of_words:
-        if bool(word not in known_vocabulary) ^ invert_filter:  # Flip comparison if invert_filter
-            new_list_of_words.append(word)
-    return new_list_of_words
+    known_vocabulary = wanikani_handler.get_known_vocabulary_set()
+    if invert_filter:
+        return [word for word in list_of_words if word in known_vocabulary]
+    return [word for word in list_of_words if word not in known_vocabulary]
 
 def filter_out_unknown_kanji(list_of_words: list[str], wanikani_handler: WaniKaniHandler, invert_filter: bool = False) -> list[str]:
     """
@@ -79,21 +86,7 @@ def filter_out_unknown_kanji(list_of_words: list[str], wanikani_handler: WaniKan
     :param invert_filter: whether the filter should be inverted (i.e. filter out words of only known kanji)
     :return: new, filtered list of words
     """
-    known_characters = _KANA_LIST + wanikani_handler.get_known_kanji_list()
-    new_list_of_words = []
-    if invert_filter is False:
-        for word in list_of_words:
-            for character in word:
-                if character not in known_characters:
-                    break
-            else:
-                new_list_of_words.append(word)
-    else:
-        for word in list_of_words:
-            for character in word:
-                if character not in known_characters:
-                    break
-            else:
-                continue  # Continue to the outer loop to skip appending
-            new_list_of_words.append(word)
-    return new_list_of_words
+    known_characters = _KANA_SET | wanikani_handler.get_known_kanji_set()
+    if invert_filter:
+        return [word for word in list_of_words if not known_characters.issuperset(word)]
+    return [word for word in list_of_words if known_characters.issuperset(word)]
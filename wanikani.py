@@ -1,5 +1,12 @@
-import json
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 WANIKANI_CACHE_FILE = "WaniKani_Cache.json"
 
@@ -10,150 +17,252 @@ class WaniKaniHandler:
         Takes data from the cache file.
         :param api_token: the user's WaniKani API Token. Only needs read permissions
         """
-        self._api_token = api_token
-        with open(WANIKANI_CACHE_FILE, "r", encoding='utf-8') as cache_file:
-            self._data_dictionary = json.load(cache_file)
+        self._session = requests.Session()
+        self._session.headers.update({
+            "Authorization": "Bearer " + api_token
+        })
+        self._session.mount("https://", HTTPAdapter(
+            pool_maxsize=4,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        ))
+        with open(WANIKANI_CACHE_FILE, "rb") as cache_file:
+            self._data_dictionary = orjson.loads(cache_file.read())
+        self._data_dictionary.setdefault("last_updated", {})
+        self._cache_file_hash = None  # Only worked out once the cache is about to be written
+        self._known_kanji_list = None
+        self._known_kanji_set = None
+        self._known_vocabulary_list = None
+        self._known_vocabulary_set = None
 
-    def _get_data_from_api(self, endpoint: str, parameters: dict[str, str]) -> list[dict]:
+    def _get_data_from_api(self, endpoint: str, parameters: dict[str, str]) -> tuple[list[dict], Optional[str]]:
         """
         Wrapper for calling the WaniKani API. Packages the received data into a list
         :param endpoint: URL endpoint for the API request
         :param parameters: Parameters and Filters for the initial API request
-        :return: List of JSON objects received from the request
+        :return: List of JSON objects received from the request,
+                 and the server's last update time of the requested data (None if no data was received)
         """
+        # Page sizes are fixed by WaniKani (1000 subjects or 500 assignments per page) and can't be raised,
+        # and requests already asks for gzip-compressed responses, so each page is as cheap as it gets
         data_array = []
+        data_updated_at = None
         next_page = "https://api.wanikani.com/v2/" + endpoint
         while next_page is not None:
-            response_json = requests.request(
-                method="GET",
+            response = self._session.get(
                 url=next_page,
-                headers={
-                    "Authorization": "Bearer " + self._api_token
-                },
-                params=parameters
-            ).json()
+                params=parameters,
+                timeout=30
+            )
+            response_json = orjson.loads(response.content)
             data_array += response_json["data"]
+            if parameters is not None:  # The whole collection shares the first page's update time
+                data_updated_at = response_json["data_updated_at"]
             parameters = None
             next_page = response_json["pages"]["next_url"]
-        return data_array
+        return data_array, data_updated_at
+
+    def close(self) -> None:
+        """
+        Closes the connections held open to the WaniKani API
+        """
+        self._session.close()
 
     def download_all_data(self) -> None:
         """
         Downloads the subjects and assignments for both vocabulary and kanji.
+        Only the data updated since the last download is fetched, if there is one.
         Writes the downloaded data to the cache file
         """
-        self.download_wanikani_vocabulary()
-        self.download_wanikani_kanji()
-        self.download_user_known_vocabulary()
-        self.download_user_known_kanji()
+        # The four downloads are independent of each other and mostly spent waiting on the network
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [
+                executor.submit(self.download_wanikani_vocabulary),
+                executor.submit(self.download_wanikani_kanji),
+                executor.submit(self.download_user_known_vocabulary),
+                executor.submit(self.download_user_known_kanji)
+            ]
+            for future in futures:
+                future.result()  # Re-raises any exception from the download
         self.write_cache()
 
+    def _download_to_data_dictionary(self, data_key: str, endpoint: str, parameters: dict[str, str]) -> None:
+        """
+        Downloads subjects or assignments from the WaniKani API and stores them in the data dictionary.
+        Subjects are stored as (subject_id : characters) pairs, assignments as (subject_id : srs_stage) pairs.
+        The subject_id is always stored as a string.
+        If the data has been downloaded before, only the entries updated since then are downloaded and merged in
+        :param data_key: Key of the data dictionary to store the downloaded data under
+        :param endpoint: Either "subjects" or "assignments"
+        :param parameters: Parameters and Filters for the initial API request
+        """
+        last_update_time = self._data_dictionary["last_updated"].get(data_key)
+        if last_update_time is None or data_key not in self._data_dictionary:
+            data_list, update_time = self._get_data_from_api(endpoint, parameters)
+            if endpoint == "subjects":
+                self._data_dictionary[data_key] = {
+                    str(subject["id"]): subject["data"]["characters"] for subject in data_list
+                }
+            else:
+                self._data_dictionary[data_key] = {
+                    str(assignment["data"]["subject_id"]): assignment["data"]["srs_stage"] for assignment in data_list
+                }
+        else:
+            parameters = dict(parameters, updated_after=last_update_time)
+            data_dictionary = self._data_dictionary[data_key]
+            if endpoint == "subjects":
+                data_list, update_time = self._get_data_from_api(endpoint, parameters)
+                for subject in data_list:
+                    data_dictionary[str(subject["id"])] = subject["data"]["characters"]
+            else:
+                # Assignments that dropped out of the wanted SRS stages have to be removed,
+                # so ask for every stage and filter them here instead
+                srs_stages = {int(srs_stage) for srs_stage in parameters.pop("srs_stages").split(",")}
+                data_list, update_time = self._get_data_from_api(endpoint, parameters)
+                for assignment in data_list:
+                    subject_id = str(assignment["data"]["subject_id"])
+                    if assignment["data"]["srs_stage"] in srs_stages:
+                        data_dictionary[subject_id] = assignment["data"]["srs_stage"]
+                    else:
+                        data_dictionary.pop(subject_id, None)
+        if update_time is not None:  # None if nothing was returned, in which case the previous time still applies
+            self._data_dictionary["last_updated"][data_key] = update_time
+
     def download_wanikani_kanji(self) -> None:
         """
         Downloads all the WaniKani kanji subjects.
-        Stored in a dictionary as a (subject_id : kanji_string) pair
+        Stored in a dictionary as a (subject_id : kanji_string) pair, with the subject_id as a string
         Does not write the downloaded data to the cache file. For this, use write_cache()
         """
-        kanji_subjects_list = self._get_data_from_api(
+        self._download_to_data_dictionary(
+            data_key="all_kanji_subjects",
             endpoint="subjects",
             parameters={
                 "types": "kanji"
             }
         )
-        id_to_kanji_dictionary = {}
-        for kanji in kanji_subjects_list:
-            id_to_kanji_dictionary[kanji["id"]] = kanji["data"]["characters"]
-
-        self._data_dictionary["all_kanji_subjects"] = id_to_kanji_dictionary
+        self._known_kanji_list = None
+        self._known_kanji_set = None
         print("Wanikani Kanji Subjects have been updated")
 
     def download_wanikani_vocabulary(self) -> None:
         """
         Downloads all the WaniKani vocabulary subjects
-        Stored in a dictionary as a (subject_id : vocabulary_string) pair
+        Stored in a dictionary as a (subject_id : vocabulary_string) pair, with the subject_id as a string
         Does not write the downloaded data to the cache file. For this, use write_cache()
         """
-        vocabulary_subjects_list = self._get_data_from_api(
+        self._download_to_data_dictionary(
+            data_key="all_vocabulary_subjects",
             endpoint="subjects",
             parameters={
                 "types": "vocabulary,kana_vocabulary"
             }
         )
-        id_to_vocabulary_dictionary = {}
-        for vocabulary in vocabulary_subjects_list:
-            id_to_vocabulary_dictionary[vocabulary["id"]] = vocabulary["data"]["characters"]
-
-        self._data_dictionary["all_vocabulary_subjects"] = id_to_vocabulary_dictionary
+        self._known_vocabulary_list = None
+        self._known_vocabulary_set = None
         print("Wanikani Vocabulary Subjects have been updated")
 
     def download_user_known_kanji(self) -> None:
         """
         Downloads user's kanji assignments that are Guru level or higher
-        Stored in a dictionary as a (subject_id : srs_stage) pair
+        Stored in a dictionary as a (subject_id : srs_stage) pair, with the subject_id as a string
         Does not write the downloaded data to the cache file. For this, use write_cache()
         """
-        kanji_assignments_list = self._get_data_from_api(
+        self._download_to_data_dictionary(
+            data_key="user_kanji_assignments",
             endpoint="assignments",
             parameters={
                 "subject_types": "kanji",
                 "srs_stages": "5,6,7,8,9"
             }
         )
-        id_to_srs_dictionary = {}
-        for kanji in kanji_assignments_list:
-            id_to_srs_dictionary[kanji["data"]["subject_id"]] = kanji["data"]["srs_stage"]
-
-        self._data_dictionary["user_kanji_assignments"] = id_to_srs_dictionary
+        self._known_kanji_list = None
+        self._known_kanji_set = None
         print("User Kanji Assignments have been updated")
 
     def download_user_known_vocabulary(self) -> None:
         """
         Downloads user's vocabulary assignments that are Apprentice level or higher
-        Stored in a dictionary as a (subject_id : srs_stage) pair
+        Stored in a dictionary as a (subject_id : srs_stage) pair, with the subject_id as a string
         Does not write the downloaded data to the cache file. For this, use write_cache()
         """
-        vocabulary_assignments_list = self._get_data_from_api(
+        self._download_to_data_dictionary(
+            data_key="user_vocabulary_assignments",
             endpoint="assignments",
             parameters={
                 "subject_types": "vocabulary,kana_vocabulary",
                 "srs_stages": "1,2,3,4,5,6,7,8,9"
             }
         )
-        id_to_srs_dictionary = {}
-        for vocabulary in vocabulary_assignments_list:
-            id_to_srs_dictionary[vocabulary["data"]["subject_id"]] = vocabulary["data"]["srs_stage"]
-
-        self._data_dictionary["user_vocabulary_assignments"] = id_to_srs_dictionary
+        self._known_vocabulary_list = None
+        self._known_vocabulary_set = None
         print("User Vocabulary Assignments have been updated")
 
     def write_cache(self) -> None:
         """
-        Writes the currently held data to the cache file
+        Writes the currently held data to the cache file.
+        Skipped if the cache file already holds exactly this data
         """
-        with open(WANIKANI_CACHE_FILE, "w", encoding='utf-8') as cache_file:
-            json.dump(
-                self._data_dictionary,
-                cache_file,
-                indent=3,
-                ensure_ascii=False
-            )
+        cache_file_contents = orjson.dumps(self._data_dictionary)
+        cache_file_hash = hashlib.blake2b(cache_file_contents, digest_size=16).digest()
+        if self._cache_file_hash is None:
+            with open(WANIKANI_CACHE_FILE, "rb") as cache_file:
+                self._cache_file_hash = hashlib.blake2b(cache_file.read(), digest_size=16).digest()
+        if cache_file_hash == self._cache_file_hash:
+            return
+        # Write to a temporary file first so an interrupted write can't leave behind a broken cache file
+        temporary_cache_file_path = WANIKANI_CACHE_FILE + ".tmp"
+        try:
+            with open(temporary_cache_file_path, "wb") as cache_file:
+                cache_file.write(cache_file_contents)
+                cache_file.flush()
+                os.fsync(cache_file.fileno())
+        except BaseException:
+            if os.path.exists(temporary_cache_file_path):
+                os.remove(temporary_cache_file_path)
+            raise
+        os.replace(temporary_cache_file_path, WANIKANI_CACHE_FILE)
+        self._cache_file_hash = cache_file_hash
 
     def get_known_kanji_list(self) -> list[str]:
         """
         Cross-references the user and wanikani data to produce a list of known kanji
+        Built once and reused until the kanji data is downloaded again
         :return: List containing unicode strings of kanji
         """
-        known_kanji_list = []
-        for lesson_id in self._data_dictionary["user_kanji_assignments"]:
-            known_kanji_list.append(self._data_dictionary["all_kanji_subjects"][lesson_id])
-        return known_kanji_list
+        if self._known_kanji_list is None:
+            all_kanji_subjects = self._data_dictionary["all_kanji_subjects"]
+            self._known_kanji_list = [
+                all_kanji_subjects[lesson_id] for lesson_id in self._data_dictionary["user_kanji_assignments"]
+            ]
+        return list(self._known_kanji_list)  # Copy so callers can't modify the cached list
 
     def get_known_vocabulary_list(self) -> list[str]:
         """
         Cross-references the user and wanikani data to produce a list of known vocabulary words
+        Built once and reused until the vocabulary data is downloaded again
         :return: List containing unicode strings of vocabulary words
         """
-        known_vocabulary_list = []
-        for lesson_id in self._data_dictionary["user_vocabulary_assignments"]:
-            known_vocabulary_list.append(self._data_dictionary["all_vocabulary_subjects"][lesson_id])
-        return known_vocabulary_list
+        if self._known_vocabulary_list is None:
+            all_vocabulary_subjects = self._data_dictionary["all_vocabulary_subjects"]
+            self._known_vocabulary_list = [
+                all_vocabulary_subjects[lesson_id] for lesson_id in self._data_dictionary["user_vocabulary_assignments"]
+            ]
+        return list(self._known_vocabulary_list)  # Copy so callers can't modify the cached list
+
+    def get_known_kanji_set(self) -> frozenset[str]:
+        """
+        Same as get_known_kanji_list(), but as a set for fast lookups
+        :return: Set containing unicode strings of kanji
+        """
+        if self._known_kanji_set is None:
+            self._known_kanji_set = frozenset(self.get_known_kanji_list())
+        return self._known_kanji_set
+
+    def get_known_vocabulary_set(self) -> frozenset[str]:
+        """
+        Same as get_known_vocabulary_list(), but as a set for fast lookups
+        :return: Set containing unicode strings of vocabulary words
+        """
+        if self._known_vocabulary_set is None:
+            self._known_vocabulary_set = frozenset(self.get_known_vocabulary_list())
+        return self._known_vocabulary_set